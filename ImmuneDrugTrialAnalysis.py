@@ -1,164 +1,166 @@
 # PART 1: Data Management
 
 import sqlite3
-import csv
+import os
+from itertools import islice
 import pandas as pd
 
 print("PART 1: Data Management")
 
-conn = sqlite3.connect("ImmuneDrugTrial.db")
+# One connection is shared by every part so the page cache stays warm between them
+conn = sqlite3.connect("ImmuneDrugTrial.db", isolation_level=None)
 cur = conn.cursor()
 
-cur.execute("PRAGMA foreign_keys = ON;")
-
+# WAL + synchronous=OFF avoids an fsync per batch; these can't be changed inside a transaction
 cur.executescript("""
-DROP TABLE IF EXISTS countCSVStaging;
-DROP TABLE IF EXISTS Samples;
-DROP TABLE IF EXISTS Subjects;
-
-CREATE TABLE countCSVStaging (
-    project TEXT,
-    subject TEXT,
-    condition TEXT,
-    age INTEGER,
-    sex TEXT,
-    treatment TEXT,
-    response TEXT,
-    sample TEXT,
-    sample_type TEXT,
-    time_from_treatment INTEGER,
-    b_cell INTEGER,
-    cd8_t_cell INTEGER,
-    cd4_t_cell INTEGER,
-    nk_cell INTEGER,
-    monocyte INTEGER
-);
-
-CREATE TABLE Subjects (
-    project TEXT,
-    subject TEXT PRIMARY KEY,
-    condition TEXT,
-    age INTEGER,
-    sex TEXT,
-    treatment TEXT,
-    response TEXT
-);
-
-CREATE TABLE Samples (
-    subject TEXT,
-    sample TEXT PRIMARY KEY,
-    sample_type TEXT,
-    time_from_treatment INTEGER,
-    b_cell INTEGER,
-    cd8_t_cell INTEGER,
-    cd4_t_cell INTEGER,
-    nk_cell INTEGER,
-    monocyte INTEGER,
-    FOREIGN KEY (subject) REFERENCES Subjects(subject)
-);
+PRAGMA foreign_keys = ON;
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = OFF;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -200000;
 """)
 
-with open("cell-count.csv", newline="") as f:
-    reader = csv.reader(f)
-    next(reader)
-    cur.executemany("""
-        INSERT INTO countCSVStaging VALUES (
-            ?,?,?,?,?,?,?,?,?,?,?,?,?,?,?
-        )
-    """, reader)
-
-cur.executescript("""
-INSERT INTO Subjects
-SELECT DISTINCT
-    project, subject, condition, age, sex, treatment, response
-FROM countCSVStaging;
-
-INSERT INTO Samples
-SELECT DISTINCT
-    subject, sample, sample_type, time_from_treatment,
-    b_cell, cd8_t_cell, cd4_t_cell, nk_cell, monocyte
-FROM countCSVStaging;
-
-DROP TABLE countCSVStaging;
-""")
-
-conn.commit()
-conn.close()
+# pandas parses the CSV with its C engine into typed columns, so rows reach SQLite
+# as ints instead of strings; na_filter=False keeps blank responses as ''
+cell_counts = pd.read_csv("cell-count.csv", engine="c", na_filter=False, dtype={
+    'age': 'int32',
+    'time_from_treatment_start': 'int32',
+    'b_cell': 'int32',
+    'cd8_t_cell': 'int32',
+    'cd4_t_cell': 'int32',
+    'nk_cell': 'int32',
+    'monocyte': 'int32'
+})
+
+subject_columns = ['project', 'subject', 'condition', 'age', 'sex', 'treatment', 'response']
+sample_columns = ['subject', 'sample', 'sample_type', 'time_from_treatment_start',
+                  'b_cell', 'cd8_t_cell', 'cd4_t_cell', 'nk_cell', 'monocyte']
+
+# Subjects are de-duplicated here with a hash over the subject-level columns rather
+# than a SELECT DISTINCT in SQLite. Whole rows are compared, so a subject listed with
+# conflicting metadata still fails the primary key instead of being silently dropped.
+subjects = cell_counts[subject_columns].drop_duplicates().itertuples(index=False, name=None)
+samples = cell_counts[sample_columns].itertuples(index=False, name=None)
+
+# Rows are inserted with a prepared multi-row INSERT carrying ROWS_PER_STATEMENT rows,
+# so SQLite runs one statement per 64 rows; executemany is fed BATCH_SIZE rows at a
+# time and only the final partial group falls back to the single-row statement
+ROWS_PER_STATEMENT = 64
+BATCH_SIZE = 16 * ROWS_PER_STATEMENT
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def insert_rows(table, n_columns, rows):
+    row_sql = "(" + ",".join(["?"] * n_columns) + ")"
+    multi_sql = f"INSERT INTO {table} VALUES " + ",".join([row_sql] * ROWS_PER_STATEMENT)
+    single_sql = f"INSERT INTO {table} VALUES {row_sql}"
+    for batch in chunks(rows, BATCH_SIZE):
+        full = len(batch) - len(batch) % ROWS_PER_STATEMENT
+        cur.executemany(multi_sql, (
+            [value for row in batch[i:i + ROWS_PER_STATEMENT] for value in row]
+            for i in range(0, full, ROWS_PER_STATEMENT)
+        ))
+        cur.executemany(single_sql, batch[full:])
+
+# isolation_level=None turns off the sqlite3 module's implicit transactions, so the
+# schema rebuild and the whole load run as one explicit BEGIN ... COMMIT
+try:
+    cur.executescript("""
+    BEGIN;
+
+    DROP TABLE IF EXISTS Samples;
+    DROP TABLE IF EXISTS Subjects;
+
+    CREATE TABLE Subjects (
+        project TEXT,
+        subject TEXT PRIMARY KEY,
+        condition TEXT,
+        age INTEGER,
+        sex TEXT,
+        treatment TEXT,
+        response TEXT
+    );
+
+    CREATE TABLE Samples (
+        subject TEXT,
+        sample TEXT PRIMARY KEY,
+        sample_type TEXT,
+        time_from_treatment INTEGER,
+        b_cell INTEGER,
+        cd8_t_cell INTEGER,
+        cd4_t_cell INTEGER,
+        nk_cell INTEGER,
+        monocyte INTEGER,
+        FOREIGN KEY (subject) REFERENCES Subjects(subject)
+    );
+    """)
+
+    insert_rows("Subjects", len(subject_columns), subjects)
+    insert_rows("Samples", len(sample_columns), samples)
+
+    # Indexes are built after the bulk load so inserts don't have to maintain them.
+    # The composite ones cover the treatment/condition/sample_type filter used by the
+    # later analyses; ANALYZE gives the query planner statistics to choose them.
+    cur.execute("CREATE INDEX idx_samples_subject ON Samples(subject);")
+    cur.execute("CREATE INDEX idx_subjects_treat_cond ON Subjects(treatment, condition, response);")
+    cur.execute("CREATE INDEX idx_samples_type_subject ON Samples(sample_type, subject);")
+    cur.execute("ANALYZE;")
+
+    cur.execute("COMMIT;")
+except Exception:
+    if conn.in_transaction:
+        cur.execute("ROLLBACK;")
+    raise
 
 # Part 2: Initial Analysis - Data Overview
 
 print("Part 2: Initial Analysis - Data Overview")
 
-conn = sqlite3.connect("ImmuneDrugTrial.db")
-cur = conn.cursor()
+# Earlier versions of this script created SampleCellFrequencies as a view
+existing = cur.execute(
+    "SELECT type FROM sqlite_master WHERE name = 'SampleCellFrequencies'"
+).fetchone()
+if existing:
+    cur.execute(f"DROP {existing[0].upper()} SampleCellFrequencies")
 
+# Materialized once so later queries don't recompute the frequencies
 cur.executescript("""
-CREATE VIEW IF NOT EXISTS SampleCellFrequencies AS
-WITH totals AS (
+-- CROSS JOIN keeps Samples as the outer loop, so it is scanned once
+CREATE TABLE SampleCellFrequencies AS
+WITH populations(population) AS (
+    VALUES ('b_cell'), ('cd8_t_cell'), ('cd4_t_cell'), ('nk_cell'), ('monocyte')
+),
+counts AS (
     SELECT
-        subject,
-        sample,
+        Samples.subject,
+        Samples.sample,
         (b_cell + cd8_t_cell + cd4_t_cell + nk_cell + monocyte) AS total_count,
-        b_cell,
-        cd8_t_cell,
-        cd4_t_cell,
-        nk_cell,
-        monocyte
+        populations.population,
+        CASE populations.population
+            WHEN 'b_cell' THEN b_cell
+            WHEN 'cd8_t_cell' THEN cd8_t_cell
+            WHEN 'cd4_t_cell' THEN cd4_t_cell
+            WHEN 'nk_cell' THEN nk_cell
+            WHEN 'monocyte' THEN monocyte
+        END AS count
     FROM Samples
+    CROSS JOIN populations
 )
 SELECT
     subject,
     sample,
     total_count,
-    'b_cell' AS population,
-    b_cell AS count,
-    100.0 * b_cell / total_count AS percentage
-FROM totals
-
-UNION ALL
-
-SELECT
-    subject,
-    sample,
-    total_count,
-    'cd8_t_cell',
-    cd8_t_cell,
-    100.0 * cd8_t_cell / total_count
-FROM totals
-
-UNION ALL
-
-SELECT
-    subject,
-    sample,
-    total_count,
-    'cd4_t_cell',
-    cd4_t_cell,
-    100.0 * cd4_t_cell / total_count
-FROM totals
-
-UNION ALL
-
-SELECT
-    subject,
-    sample,
-    total_count,
-    'nk_cell',
-    nk_cell,
-    100.0 * nk_cell / total_count
-FROM totals
-
-UNION ALL
-
-SELECT
-    subject,
-    sample,
-    total_count,
-    'monocyte',
-    monocyte,
-    100.0 * monocyte / total_count
-FROM totals;
-
+    population,
+    count,
+    100.0 * count / total_count AS percentage
+FROM counts;
+
+CREATE INDEX idx_scf_population ON SampleCellFrequencies(population);
+CREATE INDEX idx_scf_sample ON SampleCellFrequencies(sample);
+ANALYZE SampleCellFrequencies;
 """)
 
 df = pd.read_sql("""
@@ -169,9 +171,6 @@ ORDER BY sample, population;
 
 print(df.head())
 
-conn.commit()
-conn.close()
-
 # Part 3: Statistical Analysis
 print("Part 3: Statistical Analysis")
 
@@ -179,70 +178,31 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 from scipy import stats
 
-conn = sqlite3.connect("ImmuneDrugTrial.db")
-cur = conn.cursor()
-
-bCellDf = pd.read_sql("""
-SELECT Subjects.response, SampleCellFrequencies.percentage
+populations = ['b_cell', 'cd8_t_cell', 'cd4_t_cell', 'nk_cell', 'monocyte']
+population_names = {
+    'b_cell': 'B Cell',
+    'cd8_t_cell': 'CD8 T Cell',
+    'cd4_t_cell': 'CD4 T Cell',
+    'nk_cell': 'NK Cell',
+    'monocyte': 'Monocyte'
+}
+
+# One query for all populations, split per population client-side
+cellDf = pd.read_sql("""
+SELECT SampleCellFrequencies.sample, SampleCellFrequencies.population,
+       Subjects.response, SampleCellFrequencies.percentage
 FROM SampleCellFrequencies
 JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
 JOIN Subjects ON Subjects.subject = Samples.subject
 WHERE Subjects.treatment = 'miraclib'
   AND Subjects.condition = 'melanoma'
   AND Samples.sample_type = 'PBMC'
-  AND SampleCellFrequencies.population = 'b_cell'
-""", conn)
-
-cd8CellDf = pd.read_sql("""
-SELECT Subjects.response, SampleCellFrequencies.percentage
-FROM SampleCellFrequencies
-JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE Subjects.treatment = 'miraclib'
-  AND Subjects.condition = 'melanoma'
-  AND Samples.sample_type = 'PBMC'
-  AND SampleCellFrequencies.population = 'cd8_t_cell'
-""", conn)
-
-cd4CellDf = pd.read_sql("""
-SELECT Subjects.response, SampleCellFrequencies.percentage
-FROM SampleCellFrequencies
-JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE Subjects.treatment = 'miraclib'
-  AND Subjects.condition = 'melanoma'
-  AND Samples.sample_type = 'PBMC'
-  AND SampleCellFrequencies.population = 'cd4_t_cell'
-""", conn)
-
-nkCellDf = pd.read_sql("""
-SELECT Subjects.response, SampleCellFrequencies.percentage
-FROM SampleCellFrequencies
-JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE Subjects.treatment = 'miraclib'
-  AND Subjects.condition = 'melanoma'
-  AND Samples.sample_type = 'PBMC'
-  AND SampleCellFrequencies.population = 'nk_cell'
-""", conn)
-
-monocyteCellDf = pd.read_sql("""
-SELECT Subjects.response, SampleCellFrequencies.percentage
-FROM SampleCellFrequencies
-JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE Subjects.treatment = 'miraclib'
-  AND Subjects.condition = 'melanoma'
-  AND Samples.sample_type = 'PBMC'
-  AND SampleCellFrequencies.population = 'monocyte'
 """, conn)
 
+grouped = cellDf.groupby('population')
 dfs = [
-    ("B Cell", bCellDf),
-    ("CD8 T Cell", cd8CellDf),
-    ("CD4 T Cell", cd4CellDf),
-    ("NK Cell", nkCellDf),
-    ("Monocyte", monocyteCellDf)
+    (population_names[pop], grouped.get_group(pop)[['response', 'percentage']])
+    for pop in populations
 ]
 
 for name, df in dfs:
@@ -254,32 +214,47 @@ for name, df in dfs:
     plt.ylabel(name + ' Relative Frequency Percentage')
     plt.show()
 
-for name, df in dfs:
-    responders = df.loc[df['response'] == 'yes', "percentage"]
-    nonresponders = df.loc[df['response'] == 'no', "percentage"]
-    
-    t_stat, p_value = stats.ttest_ind(responders, nonresponders, equal_var=True)
-    
-    print(f"{name}")
+# Wide (samples x populations) arrays so all five t-tests run in one call
+wide = cellDf.pivot(index=['sample', 'response'], columns='population', values='percentage')[populations]
+responders = wide.xs('yes', level='response').to_numpy()
+nonresponders = wide.xs('no', level='response').to_numpy()
+
+t_stats, p_values = stats.ttest_ind(responders, nonresponders, axis=0, equal_var=True)
+
+stats_results = []
+for pop, t_stat, p_value in zip(populations, t_stats, p_values):
+    print(f"{population_names[pop]}")
     print(f"  T-statistic: {t_stat:.3f}")
     print(f"  P-value: {p_value:.4f}\n")
 
-conn.close()
+    stats_results.append({
+        'Cell Type': population_names[pop],
+        'T-statistic': round(t_stat, 3),
+        'P-value': round(p_value, 4),
+        'Significant (p<0.05)': 'Yes' if p_value < 0.05 else 'No'
+    })
+
+stats_df = pd.DataFrame(stats_results)
 
 print("We can reject the null hypothesis only for CD4 T Cells, which exhibited a p-value of 0.005 < alpha value of 0.05. The relative frequency of CD4 T Cells significantly differs between melanoma patients who respond versus those who do not respond to Miraclib treatment in PBMC samples. All other cell populations (B Cells, CD8 T Cells, NK Cells, Monocytes) showed no statistically significant differences between responders and non-responders.")
 
 # Part 4: Data Subset Analysis
 print("Part 4: Data Subset Analysis")
 
-conn = sqlite3.connect("ImmuneDrugTrial.db")
-cur = conn.cursor()
-
 filter_condition = """
 Subjects.treatment = 'miraclib' AND
 Subjects.condition = 'melanoma' AND
 Samples.sample_type = 'PBMC' AND
 Samples.time_from_treatment = 0
 """
+
+# These aggregations return a handful of rows, where pd.read_sql's overhead
+# outweighs the query itself, so build the DataFrame straight from the cursor
+def read_small(query):
+    cursor = conn.execute(query)
+    columns = [column[0] for column in cursor.description]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
 query1 = f"""
 SELECT Samples.sample, Subjects.subject, Subjects.project, Subjects.response, Subjects.sex
 FROM Samples
@@ -291,47 +266,49 @@ baseline_samples = pd.read_sql(query1, conn)
 print("Baseline PBMC melanoma samples:")
 print(baseline_samples.head())
 
+# All three breakdowns in one statement; the baseline CTE is referenced three
+# times, so SQLite materializes the filtered join once and groups it per dimension
 query2 = f"""
-SELECT Subjects.project, COUNT(Samples.sample) AS num_samples
-FROM Samples
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE {filter_condition}
-GROUP BY Subjects.project
+WITH baseline AS (
+    SELECT Subjects.project, Subjects.response, Subjects.sex, Subjects.subject, Samples.sample
+    FROM Samples
+    JOIN Subjects ON Subjects.subject = Samples.subject
+    WHERE {filter_condition}
+)
+SELECT 'project' AS dimension, project AS category, COUNT(sample) AS value
+FROM baseline
+GROUP BY project
+UNION ALL
+SELECT 'response', response, COUNT(DISTINCT subject)
+FROM baseline
+GROUP BY response
+UNION ALL
+SELECT 'sex', sex, COUNT(DISTINCT subject)
+FROM baseline
+GROUP BY sex
+ORDER BY dimension, category
 """
-samples_per_project = pd.read_sql(query2, conn)
+summary = read_small(query2)
+
+def summary_for(dimension, value_name):
+    rows = summary.loc[summary['dimension'] == dimension, ['category', 'value']]
+    return rows.rename(columns={'category': dimension, 'value': value_name}).reset_index(drop=True)
+
+samples_per_project = summary_for('project', 'num_samples')
 print("Samples per project:")
 print(samples_per_project, "\n")
 
-query3 = f"""
-SELECT Subjects.response, COUNT(DISTINCT Subjects.subject) AS num_subjects
-FROM Samples
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE {filter_condition}
-GROUP BY Subjects.response
-"""
-subjects_per_response = pd.read_sql(query3, conn)
+subjects_per_response = summary_for('response', 'num_subjects')
 print("Subjects per response (yes/no):")
 print(subjects_per_response, "\n")
 
-query4 = f"""
-SELECT Subjects.sex, COUNT(DISTINCT Subjects.subject) AS num_subjects
-FROM Samples
-JOIN Subjects ON Subjects.subject = Samples.subject
-WHERE {filter_condition}
-GROUP BY Subjects.sex
-"""
-subjects_per_sex = pd.read_sql(query4, conn)
+subjects_per_sex = summary_for('sex', 'num_subjects')
 print("Subjects per sex (M/F):")
 print(subjects_per_sex, "\n")
 
-conn.close()
-
 # Google Form Question
 print("Google Form Question")
 
-conn = sqlite3.connect("ImmuneDrugTrial.db")
-cur = conn.cursor()
-
 df = pd.read_sql(
     """        
     SELECT Subjects.project, Samples.b_cell
@@ -344,3 +321,14 @@ print(round(df["b_cell"].mean(),2))
 
 conn.close()
 
+# Save the Part 3/4 results for the dashboard, keyed by the database's mtime so a
+# rebuilt database invalidates them
+pd.to_pickle({
+    'db_mtime': os.path.getmtime("ImmuneDrugTrial.db"),
+    'cell_df': cellDf,
+    'stats_df': stats_df,
+    'baseline_samples': baseline_samples,
+    'samples_per_project': samples_per_project,
+    'subjects_per_response': subjects_per_response,
+    'subjects_per_sex': subjects_per_sex
+}, "analysis_cache.pkl")
@@ -8,34 +8,37 @@ from dash import dcc, html, dash_table
 from dash.dependencies import Input, Output
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 import sqlite3
+import os
+import re
 from scipy import stats
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 app.title = "Immune Drug Trial Dashboard"
 
-conn = sqlite3.connect("ImmuneDrugTrial.db")
+DB_PATH = "ImmuneDrugTrial.db"
+ANALYSIS_CACHE = "analysis_cache.pkl"
 
-subjects_df = pd.read_sql("SELECT * FROM Subjects ORDER BY subject", conn)
-samples_df = pd.read_sql("SELECT * FROM Samples ORDER BY sample", conn)
+conn = sqlite3.connect(DB_PATH)
 
-cell_frequencies_df = pd.read_sql("""
-    SELECT * FROM SampleCellFrequencies 
-    ORDER BY sample, population
-""", conn)
+# The label columns only hold a handful of distinct values and the counts fit in
+# narrow integers, so store them compactly before they are served to the tables
+CATEGORY_COLUMNS = ['condition', 'sex', 'response', 'treatment', 'sample_type', 'population']
+INTEGER_COLUMNS = ['b_cell', 'cd8_t_cell', 'cd4_t_cell', 'nk_cell', 'monocyte', 'age', 'time_from_treatment']
 
-def get_cell_data(population):
-    return pd.read_sql(f"""
-        SELECT Subjects.response, SampleCellFrequencies.percentage
-        FROM SampleCellFrequencies
-        JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
-        JOIN Subjects ON Subjects.subject = Samples.subject
-        WHERE Subjects.treatment = 'miraclib'
-          AND Subjects.condition = 'melanoma'
-          AND Samples.sample_type = 'PBMC'
-          AND SampleCellFrequencies.population = '{population}'
-    """, conn)
+def compact(df):
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    for column in INTEGER_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+subjects_df = compact(pd.read_sql("SELECT * FROM Subjects ORDER BY subject", conn))
+samples_df = compact(pd.read_sql("SELECT * FROM Samples ORDER BY sample", conn))
 
 populations = ['b_cell', 'cd8_t_cell', 'cd4_t_cell', 'nk_cell', 'monocyte']
 population_names = {
@@ -46,24 +49,112 @@ population_names = {
     'monocyte': 'Monocyte'
 }
 
-cell_data = {pop: get_cell_data(pop) for pop in populations}
+# Row totals and percentages of a (samples x populations) count matrix. Rows with a
+# zero total get NaN, matching the NULL that SampleCellFrequencies stores for them.
+def cell_frequencies(counts):
+    total = counts.sum(axis=1)
+    percentages = np.divide(100.0 * counts, total[:, None],
+                            out=np.full(counts.shape, np.nan), where=total[:, None] > 0)
+    return total, percentages
 
-stats_results = []
-for pop in populations:
-    df = cell_data[pop]
-    responders = df.loc[df['response'] == 'yes', "percentage"]
-    nonresponders = df.loc[df['response'] == 'no', "percentage"]
-    
-    t_stat, p_value = stats.ttest_ind(responders, nonresponders, equal_var=True)
-    
-    stats_results.append({
-        'Cell Type': population_names[pop],
-        'T-statistic': round(t_stat, 3),
-        'P-value': round(p_value, 4),
-        'Significant (p<0.05)': 'Yes' if p_value < 0.05 else 'No'
-    })
+# Above this many samples a parallel numba pass beats NumPy; below it the JIT
+# start-up cost outweighs the gain, so numba is never imported
+NUMBA_MIN_ROWS = 1_000_000
+
+def load_numba_cell_frequencies():
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return cell_frequencies
+
+    @njit(parallel=True, cache=True)
+    def numba_cell_frequencies(counts):
+        n, k = counts.shape
+        total = np.empty(n, dtype=np.int64)
+        percentages = np.empty((n, k), dtype=np.float64)
+        for i in prange(n):
+            row_total = 0
+            for j in range(k):
+                row_total += counts[i, j]
+            total[i] = row_total
+            for j in range(k):
+                percentages[i, j] = 100.0 * counts[i, j] / row_total if row_total > 0 else np.nan
+        return total, percentages
+
+    return numba_cell_frequencies
+
+# Frequencies are plain arithmetic on samples_df, so compute them in NumPy instead of
+# re-reading SampleCellFrequencies. Columns are taken in alphabetical order so the
+# flattened rows come out sorted by sample, population.
+frequency_columns = sorted(populations)
+counts = samples_df[frequency_columns].to_numpy()
+compute_frequencies = load_numba_cell_frequencies() if len(samples_df) > NUMBA_MIN_ROWS else cell_frequencies
+total_count, percentages = compute_frequencies(counts)
 
-stats_df = pd.DataFrame(stats_results)
+cell_frequencies_df = compact(pd.DataFrame({
+    'subject': np.repeat(samples_df['subject'].to_numpy(), len(frequency_columns)),
+    'sample': np.repeat(samples_df['sample'].to_numpy(), len(frequency_columns)),
+    'total_count': np.repeat(total_count, len(frequency_columns)),
+    'population': np.tile(frequency_columns, len(samples_df)),
+    'count': counts.ravel(),
+    'percentage': percentages.ravel()
+}))
+
+# ImmuneDrugTrialAnalysis.py saves the Part 3/4 results it computes, keyed by the
+# database's mtime. The cache is optional: a missing, stale or unreadable file is a
+# miss and everything below is recomputed from the database instead.
+def load_cache(path, db_path):
+    try:
+        cached = pd.read_pickle(path)
+        if cached['db_mtime'] == os.path.getmtime(db_path):
+            return cached
+    except Exception:
+        pass
+    return None
+
+analysis_cache = load_cache(ANALYSIS_CACHE, DB_PATH)
+
+if analysis_cache is not None:
+    cell_df = analysis_cache['cell_df']
+else:
+    # One query for all populations, split per population client-side
+    cell_df = pd.read_sql("""
+        SELECT SampleCellFrequencies.sample, SampleCellFrequencies.population,
+               Subjects.response, SampleCellFrequencies.percentage
+        FROM SampleCellFrequencies
+        JOIN Samples ON Samples.sample = SampleCellFrequencies.sample
+        JOIN Subjects ON Subjects.subject = Samples.subject
+        WHERE Subjects.treatment = 'miraclib'
+          AND Subjects.condition = 'melanoma'
+          AND Samples.sample_type = 'PBMC'
+    """, conn)
+
+cell_df = compact(cell_df)
+cell_data = {
+    pop: group[['response', 'percentage']].reset_index(drop=True)
+    for pop, group in cell_df.groupby('population', observed=True)
+}
+
+if analysis_cache is not None:
+    stats_df = analysis_cache['stats_df']
+else:
+    # Wide (samples x populations) arrays so all five t-tests run in one call
+    wide = cell_df.pivot(index=['sample', 'response'], columns='population', values='percentage')[populations]
+    responders = wide.xs('yes', level='response').to_numpy()
+    nonresponders = wide.xs('no', level='response').to_numpy()
+
+    t_stats, p_values = stats.ttest_ind(responders, nonresponders, axis=0, equal_var=True)
+
+    stats_results = []
+    for pop, t_stat, p_value in zip(populations, t_stats, p_values):
+        stats_results.append({
+            'Cell Type': population_names[pop],
+            'T-statistic': round(t_stat, 3),
+            'P-value': round(p_value, 4),
+            'Significant (p<0.05)': 'Yes' if p_value < 0.05 else 'No'
+        })
+
+    stats_df = pd.DataFrame(stats_results)
 
 filter_condition = """
 Subjects.treatment = 'miraclib' AND
@@ -72,38 +163,60 @@ Samples.sample_type = 'PBMC' AND
 Samples.time_from_treatment = 0
 """
 
-baseline_samples = pd.read_sql(f"""
-    SELECT Samples.sample, Subjects.subject, Subjects.project, 
-           Subjects.response, Subjects.sex
-    FROM Samples
-    JOIN Subjects ON Subjects.subject = Samples.subject
-    WHERE {filter_condition}
-    ORDER BY Samples.sample
-""", conn)
-
-samples_per_project = pd.read_sql(f"""
-    SELECT Subjects.project, COUNT(Samples.sample) AS num_samples
-    FROM Samples
-    JOIN Subjects ON Subjects.subject = Samples.subject
-    WHERE {filter_condition}
-    GROUP BY Subjects.project
-""", conn)
-
-subjects_per_response = pd.read_sql(f"""
-    SELECT Subjects.response, COUNT(DISTINCT Subjects.subject) AS num_subjects
-    FROM Samples
-    JOIN Subjects ON Subjects.subject = Samples.subject
-    WHERE {filter_condition}
-    GROUP BY Subjects.response
-""", conn)
-
-subjects_per_sex = pd.read_sql(f"""
-    SELECT Subjects.sex, COUNT(DISTINCT Subjects.subject) AS num_subjects
-    FROM Samples
-    JOIN Subjects ON Subjects.subject = Samples.subject
-    WHERE {filter_condition}
-    GROUP BY Subjects.sex
-""", conn)
+# These aggregations return a handful of rows, where pd.read_sql's overhead
+# outweighs the query itself, so build the DataFrame straight from the cursor
+def read_small(query):
+    cursor = conn.execute(query)
+    columns = [column[0] for column in cursor.description]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+def summary_for(dimension, value_name):
+    rows = summary.loc[summary['dimension'] == dimension, ['category', 'value']]
+    return rows.rename(columns={'category': dimension, 'value': value_name}).reset_index(drop=True)
+
+if analysis_cache is not None:
+    baseline_samples = analysis_cache['baseline_samples']
+    samples_per_project = analysis_cache['samples_per_project']
+    subjects_per_response = analysis_cache['subjects_per_response']
+    subjects_per_sex = analysis_cache['subjects_per_sex']
+else:
+    baseline_samples = pd.read_sql(f"""
+        SELECT Samples.sample, Subjects.subject, Subjects.project, 
+               Subjects.response, Subjects.sex
+        FROM Samples
+        JOIN Subjects ON Subjects.subject = Samples.subject
+        WHERE {filter_condition}
+        ORDER BY Samples.sample
+    """, conn)
+
+    # All three breakdowns in one statement; the baseline CTE is referenced three
+    # times, so SQLite materializes the filtered join once and groups it per dimension
+    summary = read_small(f"""
+        WITH baseline AS (
+            SELECT Subjects.project, Subjects.response, Subjects.sex, Subjects.subject, Samples.sample
+            FROM Samples
+            JOIN Subjects ON Subjects.subject = Samples.subject
+            WHERE {filter_condition}
+        )
+        SELECT 'project' AS dimension, project AS category, COUNT(sample) AS value
+        FROM baseline
+        GROUP BY project
+        UNION ALL
+        SELECT 'response', response, COUNT(DISTINCT subject)
+        FROM baseline
+        GROUP BY response
+        UNION ALL
+        SELECT 'sex', sex, COUNT(DISTINCT subject)
+        FROM baseline
+        GROUP BY sex
+        ORDER BY dimension, category
+    """)
+
+    samples_per_project = summary_for('project', 'num_samples')
+    subjects_per_response = summary_for('response', 'num_subjects')
+    subjects_per_sex = summary_for('sex', 'num_subjects')
+
+baseline_samples = compact(baseline_samples)
 
 conn.close()
 
@@ -135,85 +248,138 @@ app.layout = html.Div(style={'backgroundColor': colors['background'], 'minHeight
     html.Div(id='tabs-content', style={'marginTop': '20px'})
 ])
 
-@app.callback(Output('tabs-content', 'children'),
-              Input('tabs', 'value'))
-def render_content(tab):
-    if tab == 'tab-1':
-        return html.Div([
-            html.Div([
-                html.H2("Subjects Table", style={'color': colors['primary']}),
-                html.P(f"Total Subjects: {len(subjects_df)}", style={'fontSize': '16px', 'fontWeight': 'bold'}),
-                dash_table.DataTable(
-                    id='subjects-table',
-                    columns=[{"name": i, "id": i} for i in subjects_df.columns],
-                    data=subjects_df.to_dict('records'),
-                    filter_action="native",
-                    sort_action="native",
-                    page_size=15,
-                    style_table={'overflowX': 'auto'},
-                    style_cell={
-                        'textAlign': 'left',
-                        'padding': '10px',
-                        'fontFamily': 'Arial'
-                    },
-                    style_header={
-                        'backgroundColor': colors['primary'],
-                        'color': 'white',
-                        'fontWeight': 'bold'
-                    },
-                    style_data_conditional=[
-                        {
-                            'if': {'row_index': 'odd'},
-                            'backgroundColor': '#f9f9f9'
-                        }
-                    ]
-                )
-            ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'marginBottom': '20px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
-            
-            html.Div([
-                html.H2("Samples Table", style={'color': colors['primary']}),
-                html.P(f"Total Samples: {len(samples_df)}", style={'fontSize': '16px', 'fontWeight': 'bold'}),
-                dash_table.DataTable(
-                    id='samples-table',
-                    columns=[{"name": i, "id": i} for i in samples_df.columns],
-                    data=samples_df.to_dict('records'),
-                    filter_action="native",
-                    sort_action="native",
-                    page_size=15,
-                    style_table={'overflowX': 'auto'},
-                    style_cell={
-                        'textAlign': 'left',
-                        'padding': '10px',
-                        'fontFamily': 'Arial'
-                    },
-                    style_header={
-                        'backgroundColor': colors['primary'],
-                        'color': 'white',
-                        'fontWeight': 'bold'
-                    },
-                    style_data_conditional=[
-                        {
-                            'if': {'row_index': 'odd'},
-                            'backgroundColor': '#f9f9f9'
-                        }
-                    ]
-                )
-            ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
-        ])
-    
-    elif tab == 'tab-2':
-        return html.Div([
-            html.H2("Cell Population Frequencies by Sample", style={'color': colors['primary']}),
-            html.P("Relative frequency of each immune cell population as a percentage of total cells per sample", 
-                   style={'fontSize': '14px', 'marginBottom': '20px'}),
+# The larger tables are paged, sorted and filtered on the server, so the browser only
+# receives the rows on the current page instead of the whole DataFrame
+paged_tables = {
+    'subjects-table': subjects_df,
+    'samples-table': samples_df,
+    'frequencies-table': cell_frequencies_df,
+    'baseline-table': baseline_samples
+}
+
+# The subset of the DataTable filter_query grammar that the native column filters emit:
+#   query    := clause ( '&&' clause )*
+#   clause   := '{' column '}' relation value | '{' column '}' 'is' unary
+#   relation := ['i' | 's'] ( = | != | < | <= | > | >= | eq | ne | lt | le | gt | ge
+#                             | contains | datestartswith )
+#   unary    := blank | nil | num | str
+#   value    := a bare word, or a '...', "..." or `...` string with backslash escapes
+# A query outside this grammar, or on an unknown column, matches no rows
+FILTER_CLAUSE = re.compile(r"""\s*\{(?P<column>[^}]+)\}\s*(?:
+    is\s+(?P<unary>blank|nil|num|str)
+  | (?P<operator>[is]?(?:!=|<=|>=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith))\s*
+    (?P<value>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`(?:[^`\\]|\\.)*`|(?:[^\s"'`&]|&(?!&))+)
+)\s*(?:&&|$)""", re.VERBOSE)
+FILTER_OPERATORS = {'=': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge'}
+
+def parse_filter(filter_query):
+    clauses, pos = [], 0
+    while pos < len(filter_query):
+        match = FILTER_CLAUSE.match(filter_query, pos)
+        if match is None:
+            return None
+        clauses.append(match)
+        pos = match.end()
+    return clauses
+
+def unary_mask(series, unary):
+    values = series.astype(object)
+    if unary == 'nil':
+        return series.isna()
+    if unary == 'blank':
+        return series.isna() | (values == '')
+    if unary == 'num':
+        return series.notna() & pd.api.types.is_numeric_dtype(series)
+    return values.map(lambda v: isinstance(v, str)).astype(bool)
+
+def filter_frame(df, filter_query):
+    clauses = parse_filter(filter_query) if filter_query and filter_query.strip() else []
+    if clauses is None:
+        return df.iloc[0:0]
+    for match in clauses:
+        column, unary, operator, value = match.group('column', 'unary', 'operator', 'value')
+        if column not in df:
+            return df.iloc[0:0]
+        series = df[column]
+        if unary:
+            df = df[unary_mask(series, unary)]
+            continue
+
+        # Operators carry an optional i/s prefix for case-insensitive/sensitive matching
+        ignore_case = operator[0] == 'i'
+        if operator[0] in 'is':
+            operator = operator[1:]
+        operator = FILTER_OPERATORS.get(operator, operator)
+
+        if value[0] in '"\'`':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        if pd.api.types.is_numeric_dtype(series) and operator not in ('contains', 'datestartswith'):
+            try:
+                value = float(value)
+            except ValueError:
+                return df.iloc[0:0]
+        else:
+            series = series.astype(str)
+            if ignore_case:
+                series, value = series.str.lower(), value.lower()
+
+        if operator == 'contains':
+            df = df[series.str.contains(value, regex=False)]
+        elif operator == 'datestartswith':
+            df = df[series.str.startswith(value)]
+        else:
+            df = df[getattr(series, operator)(value)]
+    return df
+
+def register_paged_table(table_id, df):
+    @app.callback(Output(table_id, 'data'),
+                  Output(table_id, 'page_count'),
+                  Input(table_id, 'page_current'),
+                  Input(table_id, 'page_size'),
+                  Input(table_id, 'sort_by'),
+                  Input(table_id, 'filter_query'))
+    def update_page(page_current, page_size, sort_by, filter_query):
+        rows = filter_frame(df, filter_query)
+        if sort_by:
+            rows = rows.sort_values([col['column_id'] for col in sort_by],
+                                    ascending=[col['direction'] == 'asc' for col in sort_by],
+                                    kind='stable')
+        page_count = max(1, -(-len(rows) // page_size))
+        start = min(page_current, page_count - 1) * page_size
+        return rows.iloc[start:start + page_size].to_dict('records'), page_count
+    return update_page
+
+for table_id, table_df in paged_tables.items():
+    register_paged_table(table_id, table_df)
+
+response_colors = {'yes': '#2ecc71', 'no': '#e74c3c'}
+
+# Boxplots are drawn from precomputed quartiles so each figure ships five numbers
+# per box instead of every sample; whiskers span the full range of the data.
+# plotly.js's default 'linear' quartiles interpolate at p*n - 0.5, which is numpy's
+# 'hazen' method, and like plotly the NaNs are dropped first
+def box_summary(values):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75], method='hazen')
+    return dict(q1=[q1], median=[median], q3=[q3],
+                lowerfence=[values.min()], upperfence=[values.max()])
+
+def build_tab1():
+    return html.Div([
+        html.Div([
+            html.H2("Subjects Table", style={'color': colors['primary']}),
+            html.P(f"Total Subjects: {len(subjects_df)}", style={'fontSize': '16px', 'fontWeight': 'bold'}),
             dash_table.DataTable(
-                id='frequencies-table',
-                columns=[{"name": i, "id": i, "type": "numeric", "format": {"specifier": ".2f"} if i == "percentage" else {}} 
-                         for i in cell_frequencies_df.columns],
-                data=cell_frequencies_df.to_dict('records'),
-                filter_action="native",
-                sort_action="native",
-                page_size=20,
+                id='subjects-table',
+                columns=[{"name": i, "id": i} for i in subjects_df.columns],
+                page_action="custom",
+                page_current=0,
+                filter_action="custom",
+                filter_query="",
+                sort_action="custom",
+                sort_by=[],
+                page_size=15,
                 style_table={'overflowX': 'auto'},
                 style_cell={
                     'textAlign': 'left',
@@ -229,149 +395,241 @@ def render_content(tab):
                     {
                         'if': {'row_index': 'odd'},
                         'backgroundColor': '#f9f9f9'
-                    },
+                    }
+                ]
+            )
+        ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'marginBottom': '20px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
+        
+        html.Div([
+            html.H2("Samples Table", style={'color': colors['primary']}),
+            html.P(f"Total Samples: {len(samples_df)}", style={'fontSize': '16px', 'fontWeight': 'bold'}),
+            dash_table.DataTable(
+                id='samples-table',
+                columns=[{"name": i, "id": i} for i in samples_df.columns],
+                page_action="custom",
+                page_current=0,
+                filter_action="custom",
+                filter_query="",
+                sort_action="custom",
+                sort_by=[],
+                page_size=15,
+                style_table={'overflowX': 'auto'},
+                style_cell={
+                    'textAlign': 'left',
+                    'padding': '10px',
+                    'fontFamily': 'Arial'
+                },
+                style_header={
+                    'backgroundColor': colors['primary'],
+                    'color': 'white',
+                    'fontWeight': 'bold'
+                },
+                style_data_conditional=[
                     {
-                        'if': {'column_id': 'percentage'},
-                        'fontWeight': 'bold',
-                        'color': colors['secondary']
+                        'if': {'row_index': 'odd'},
+                        'backgroundColor': '#f9f9f9'
                     }
                 ]
             )
         ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
-    
-    elif tab == 'tab-3':
-
-        boxplot_figures = []
-        for pop in populations:
-            df = cell_data[pop]
-            fig = px.box(df, x='response', y='percentage', 
-                        title=f"{population_names[pop]} Relative Frequency by Drug Response",
-                        labels={'response': 'Patient Responded to Drug', 
-                               'percentage': f'{population_names[pop]} Relative Frequency (%)'},
-                        color='response',
-                        color_discrete_map={'yes': '#2ecc71', 'no': '#e74c3c'})
-            
-            fig.update_layout(
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                font={'size': 12},
-                showlegend=True,
-                height=400
-            )
-            
-            boxplot_figures.append(
-                html.Div([
-                    dcc.Graph(figure=fig)
-                ], style={'marginBottom': '20px'})
-            )
+    ])
+
+def build_tab2():
+    return html.Div([
+        html.H2("Cell Population Frequencies by Sample", style={'color': colors['primary']}),
+        html.P("Relative frequency of each immune cell population as a percentage of total cells per sample", 
+               style={'fontSize': '14px', 'marginBottom': '20px'}),
+        dash_table.DataTable(
+            id='frequencies-table',
+            columns=[{"name": i, "id": i, "type": "numeric", "format": {"specifier": ".2f"} if i == "percentage" else {}} 
+                     for i in cell_frequencies_df.columns],
+            page_action="custom",
+            page_current=0,
+            filter_action="custom",
+            filter_query="",
+            sort_action="custom",
+            sort_by=[],
+            page_size=20,
+            style_table={'overflowX': 'auto'},
+            style_cell={
+                'textAlign': 'left',
+                'padding': '10px',
+                'fontFamily': 'Arial'
+            },
+            style_header={
+                'backgroundColor': colors['primary'],
+                'color': 'white',
+                'fontWeight': 'bold'
+            },
+            style_data_conditional=[
+                {
+                    'if': {'row_index': 'odd'},
+                    'backgroundColor': '#f9f9f9'
+                },
+                {
+                    'if': {'column_id': 'percentage'},
+                    'fontWeight': 'bold',
+                    'color': colors['secondary']
+                }
+            ]
+        )
+    ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
+
+def build_tab3():
+    boxplot_figures = []
+    for pop in populations:
+        df = cell_data[pop]
+        fig = go.Figure([
+            go.Box(name=response, x=[response],
+                   marker_color=response_colors[response],
+                   **box_summary(df.loc[df['response'] == response, 'percentage']))
+            for response in df['response'].unique()
+        ])
         
-        return html.Div([
-            html.H2("Statistical Analysis: Melanoma Patients on Miraclib (PBMC Samples)", 
-                    style={'color': colors['primary']}),
-            html.P("Comparing cell population frequencies between responders and non-responders", 
-                   style={'fontSize': '14px', 'marginBottom': '20px'}),
-            
-            html.Div([
-                html.H3("Statistical Test Results (Two-Sample t-test)", style={'color': colors['primary']}),
-                dash_table.DataTable(
-                    columns=[{"name": i, "id": i} for i in stats_df.columns],
-                    data=stats_df.to_dict('records'),
-                    style_cell={
-                        'textAlign': 'center',
-                        'padding': '12px',
-                        'fontFamily': 'Arial'
-                    },
-                    style_header={
-                        'backgroundColor': colors['primary'],
-                        'color': 'white',
-                        'fontWeight': 'bold'
-                    },
-                    style_data_conditional=[
-                        {
-                            'if': {
-                                'filter_query': '{Significant (p<0.05)} = "Yes"',
-                                'column_id': 'Significant (p<0.05)'
-                            },
-                            'backgroundColor': '#d4edda',
-                            'color': '#155724',
-                            'fontWeight': 'bold'
-                        }
-                    ]
-                )
-            ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 
-                     'marginBottom': '30px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
-            
+        fig.update_layout(
+            title=f"{population_names[pop]} Relative Frequency by Drug Response",
+            xaxis_title='Patient Responded to Drug',
+            yaxis_title=f'{population_names[pop]} Relative Frequency (%)',
+            legend_title_text='Patient Responded to Drug',
+            boxmode='overlay',
+            plot_bgcolor='white',
+            paper_bgcolor='white',
+            font={'size': 12},
+            showlegend=True,
+            height=400
+        )
+        
+        boxplot_figures.append(
             html.Div([
-                html.H3("Distribution Comparisons", style={'color': colors['primary'], 'marginBottom': '20px'}),
-                *boxplot_figures
-            ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
-        ])
+                dcc.Graph(figure=fig)
+            ], style={'marginBottom': '20px'})
+        )
     
-    elif tab == 'tab-4':
-        fig1 = px.bar(samples_per_project, x='project', y='num_samples',
-                     title='Samples per Project',
-                     labels={'project': 'Project', 'num_samples': 'Number of Samples'},
-                     color='num_samples',
-                     color_continuous_scale='Blues')
-        fig1.update_layout(plot_bgcolor='white', paper_bgcolor='white', showlegend=False)
+    return html.Div([
+        html.H2("Statistical Analysis: Melanoma Patients on Miraclib (PBMC Samples)", 
+                style={'color': colors['primary']}),
+        html.P("Comparing cell population frequencies between responders and non-responders", 
+               style={'fontSize': '14px', 'marginBottom': '20px'}),
         
-        fig2 = px.bar(subjects_per_response, x='response', y='num_subjects',
-                     title='Subjects by Response Status',
-                     labels={'response': 'Response to Treatment', 'num_subjects': 'Number of Subjects'},
-                     color='response',
-                     color_discrete_map={'yes': '#2ecc71', 'no': '#e74c3c'})
-        fig2.update_layout(plot_bgcolor='white', paper_bgcolor='white')
+        html.Div([
+            html.H3("Statistical Test Results (Two-Sample t-test)", style={'color': colors['primary']}),
+            dash_table.DataTable(
+                columns=[{"name": i, "id": i} for i in stats_df.columns],
+                data=stats_df.to_dict('records'),
+                style_cell={
+                    'textAlign': 'center',
+                    'padding': '12px',
+                    'fontFamily': 'Arial'
+                },
+                style_header={
+                    'backgroundColor': colors['primary'],
+                    'color': 'white',
+                    'fontWeight': 'bold'
+                },
+                style_data_conditional=[
+                    {
+                        'if': {
+                            'filter_query': '{Significant (p<0.05)} = "Yes"',
+                            'column_id': 'Significant (p<0.05)'
+                        },
+                        'backgroundColor': '#d4edda',
+                        'color': '#155724',
+                        'fontWeight': 'bold'
+                    }
+                ]
+            )
+        ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 
+                 'marginBottom': '30px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
         
-        fig3 = px.bar(subjects_per_sex, x='sex', y='num_subjects',
-                     title='Subjects by Sex',
-                     labels={'sex': 'Sex', 'num_subjects': 'Number of Subjects'},
-                     color='sex',
-                     color_discrete_map={'M': '#3498db', 'F': '#e74c3c'})
-        fig3.update_layout(plot_bgcolor='white', paper_bgcolor='white')
+        html.Div([
+            html.H3("Distribution Comparisons", style={'color': colors['primary'], 'marginBottom': '20px'}),
+            *boxplot_figures
+        ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
+    ])
+
+def build_tab4():
+    fig1 = px.bar(samples_per_project, x='project', y='num_samples',
+                 title='Samples per Project',
+                 labels={'project': 'Project', 'num_samples': 'Number of Samples'},
+                 color='num_samples',
+                 color_continuous_scale='Blues')
+    fig1.update_layout(plot_bgcolor='white', paper_bgcolor='white', showlegend=False)
+    
+    fig2 = px.bar(subjects_per_response, x='response', y='num_subjects',
+                 title='Subjects by Response Status',
+                 labels={'response': 'Response to Treatment', 'num_subjects': 'Number of Subjects'},
+                 color='response',
+                 color_discrete_map=response_colors)
+    fig2.update_layout(plot_bgcolor='white', paper_bgcolor='white')
+    
+    fig3 = px.bar(subjects_per_sex, x='sex', y='num_subjects',
+                 title='Subjects by Sex',
+                 labels={'sex': 'Sex', 'num_subjects': 'Number of Subjects'},
+                 color='sex',
+                 color_discrete_map={'M': '#3498db', 'F': '#e74c3c'})
+    fig3.update_layout(plot_bgcolor='white', paper_bgcolor='white')
+    
+    return html.Div([
+        html.H2("Subset Analysis: Baseline Melanoma PBMC Samples (Miraclib Treatment)", 
+                style={'color': colors['primary']}),
+        html.P("Analysis of samples at baseline (time_from_treatment = 0)", 
+               style={'fontSize': '14px', 'marginBottom': '20px'}),
         
-        return html.Div([
-            html.H2("Subset Analysis: Baseline Melanoma PBMC Samples (Miraclib Treatment)", 
-                    style={'color': colors['primary']}),
-            html.P("Analysis of samples at baseline (time_from_treatment = 0)", 
-                   style={'fontSize': '14px', 'marginBottom': '20px'}),
-            
-            html.Div([
-                html.H3(f"Baseline Samples (n={len(baseline_samples)})", style={'color': colors['primary']}),
-                dash_table.DataTable(
-                    columns=[{"name": i, "id": i} for i in baseline_samples.columns],
-                    data=baseline_samples.to_dict('records'),
-                    filter_action="native",
-                    sort_action="native",
-                    page_size=10,
-                    style_cell={
-                        'textAlign': 'left',
-                        'padding': '10px',
-                        'fontFamily': 'Arial'
-                    },
-                    style_header={
-                        'backgroundColor': colors['primary'],
-                        'color': 'white',
-                        'fontWeight': 'bold'
-                    },
-                    style_data_conditional=[
-                        {
-                            'if': {'row_index': 'odd'},
-                            'backgroundColor': '#f9f9f9'
-                        }
-                    ]
-                )
-            ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 
-                     'marginBottom': '20px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
-            
+        html.Div([
+            html.H3(f"Baseline Samples (n={len(baseline_samples)})", style={'color': colors['primary']}),
+            dash_table.DataTable(
+                id='baseline-table',
+                columns=[{"name": i, "id": i} for i in baseline_samples.columns],
+                page_action="custom",
+                page_current=0,
+                filter_action="custom",
+                filter_query="",
+                sort_action="custom",
+                sort_by=[],
+                page_size=10,
+                style_cell={
+                    'textAlign': 'left',
+                    'padding': '10px',
+                    'fontFamily': 'Arial'
+                },
+                style_header={
+                    'backgroundColor': colors['primary'],
+                    'color': 'white',
+                    'fontWeight': 'bold'
+                },
+                style_data_conditional=[
+                    {
+                        'if': {'row_index': 'odd'},
+                        'backgroundColor': '#f9f9f9'
+                    }
+                ]
+            )
+        ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 
+                 'marginBottom': '20px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}),
+        
+        html.Div([
+            html.H3("Summary Statistics", style={'color': colors['primary'], 'marginBottom': '20px'}),
             html.Div([
-                html.H3("Summary Statistics", style={'color': colors['primary'], 'marginBottom': '20px'}),
-                html.Div([
-                    html.Div([dcc.Graph(figure=fig1)], style={'width': '33%', 'display': 'inline-block'}),
-                    html.Div([dcc.Graph(figure=fig2)], style={'width': '33%', 'display': 'inline-block'}),
-                    html.Div([dcc.Graph(figure=fig3)], style={'width': '33%', 'display': 'inline-block'}),
-                ])
-            ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
-        ])
+                html.Div([dcc.Graph(figure=fig1)], style={'width': '33%', 'display': 'inline-block'}),
+                html.Div([dcc.Graph(figure=fig2)], style={'width': '33%', 'display': 'inline-block'}),
+                html.Div([dcc.Graph(figure=fig3)], style={'width': '33%', 'display': 'inline-block'}),
+            ])
+        ], style={'backgroundColor': colors['card'], 'padding': '20px', 'borderRadius': '10px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'})
+    ])
+
+# Tab contents only depend on the data loaded above, so each tab is built once at
+# import time and the callback returns the prebuilt layout
+TAB_CONTENT = {
+    'tab-1': build_tab1(),
+    'tab-2': build_tab2(),
+    'tab-3': build_tab3(),
+    'tab-4': build_tab4()
+}
+
+@app.callback(Output('tabs-content', 'children'),
+              Input('tabs', 'value'))
+def render_content(tab):
+    return TAB_CONTENT.get(tab)
 
 if __name__ == '__main__':
     print("\n" + "="*60)
@@ -385,4 +643,4 @@ if __name__ == '__main__':
     print("\nOpening dashboard at: http://127.0.0.1:8050/")
     print("="*60 + "\n")
     
-    app.run(debug=False, host='127.0.0.1', port=8050)
\ No newline at end of file
+    app.run(debug=False, threaded=True, host='127.0.0.1', port=8050)
\ No newline at end of file